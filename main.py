@@ -1,75 +1,229 @@
+import asyncio
+import concurrent.futures
+import multiprocessing
+import os
 import time
+from concurrent.futures.process import BrokenProcessPool
 
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
 from urllib.parse import urlencode
 
-from recorder import StreamRecorder
+from recorder import run_recorder
+from supervisor import RecorderSupervisor
+
+
+class RecorderProcess:
+    """Handle for a StreamRecorder running in one of Go2RTCClient's worker processes."""
+
+    def __init__(self, future, stop_event):
+        self.future = future
+        self.stop_event = stop_event
+
+    def running(self):
+        """Whether the worker is still recording (or waiting to start)."""
+        return not self.future.done()
+
+    def stop(self):
+        """Signal the worker to stop its recording and wait for it to finish."""
+        self.stop_event.set()
+        try:
+            self.future.result()
+        except Exception as e:
+            print(f"❌ Recorder process failed: {e}")
 
 
 class Go2RTCClient:
     """Manages go2rtc API interactions and recording sessions."""
 
-    def __init__(self, base_url='http://localhost:1984', output_dir='/path/to/save/recordings'):
+    # Each worker just waits on its gst-launch child, so the pool is sized by streams rather than CPUs;
+    # workers are spawned on demand, so unused slots cost nothing.
+    MAX_RECORDERS = 64
+
+    def __init__(self, base_url='http://localhost:1984', output_dir='/path/to/save/recordings', shared_pipeline=False,
+                 max_workers=None):
         self.base_url = base_url
-        self.recorders = {}  # Stores active recordings {stream_name: StreamRecorder}
+        self.recorders = {}  # Stores active recordings {stream_name: RecorderProcess or SupervisedStream}
         self.output_dir = output_dir
+        self._cache = {}  # Recent GET responses {endpoint: (fetched_at, result)}
 
-    def _send_request(self, method, endpoint, params=None):
-        """Helper method to send requests with URL encoding and error handling."""
+        # Reuse keep-alive connections to the go2rtc API instead of reconnecting on every call
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+
+        # Optionally record every (H.264) stream through one shared GStreamer pipeline instead of
+        # one worker process and gst-launch subprocess per stream.
+        self.supervisor = None
+        self._pool = None
+        self.max_workers = max_workers or self.MAX_RECORDERS
+        if shared_pipeline:
+            self.supervisor = RecorderSupervisor(output_dir)
+            self.supervisor.start()
+        else:
+            # Each recorder lives in its own worker process so recorders don't contend for one GIL.
+            # Workers are spawned rather than forked because the parent may already run GStreamer threads.
+            self._context = multiprocessing.get_context('spawn')
+            self._manager = self._context.Manager()
+            self._pool = self._create_pool()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Stop all recordings, close the API session and shut down the recording backend."""
+        for stream_name in list(self.recorders):
+            self.stop_recording(stream_name)
+
+        self._session.close()
+        if self.supervisor:
+            self.supervisor.stop()
+        if self._pool:
+            self._pool.shutdown()
+            self._manager.shutdown()
+
+    def _create_pool(self):
+        """Create the worker pool that runs one StreamRecorder per stream."""
+        return concurrent.futures.ProcessPoolExecutor(max_workers=self.max_workers, mp_context=self._context)
+
+    def _request(self, method, endpoint, params=None):
+        """Send a request with URL encoding, raising requests.RequestException if it fails."""
         url = f"{self.base_url}{endpoint}"
         if params:
             url += f"?{urlencode(params)}"
 
+        response = self._session.request(method, url, timeout=5)
+        response.raise_for_status()
+
+        if not response.text.strip():
+            print(f"✅ {method} request to {endpoint} completed successfully.")
+            return {}
+        return response.json()
+
+    def _send_request(self, method, endpoint, params=None):
+        """Helper method to send requests with URL encoding and error handling."""
         try:
-            response = requests.request(method, url)
+            return self._request(method, endpoint, params)
+        except requests.RequestException as e:
+            print(f'❌ API error on {method} request to {endpoint}: {e}')
+            return {}
+
+    def _cached_get(self, endpoint, ttl=2.0):
+        """GET an endpoint, reusing the previous successful response if it is younger than ttl seconds."""
+        cached = self._cache.get(endpoint)
+        if cached and time.monotonic() - cached[0] < ttl:
+            return cached[1]
+
+        try:
+            result = self._request('GET', endpoint)
+        except requests.RequestException as e:
+            # Don't cache failures, or a transient error would read as "nothing found" for the whole TTL
+            print(f'❌ API error on GET request to {endpoint}: {e}')
+            return {}
+
+        self._cache[endpoint] = (time.monotonic(), result)
+        return result
+
+    async def _send_request_async(self, client, method, endpoint, params=None):
+        """Async counterpart of _send_request with the same error handling."""
+        try:
+            response = await client.request(method, endpoint, params=params)
+            response.raise_for_status()
 
             if not response.text.strip():
                 print(f"✅ {method} request to {endpoint} completed successfully.")
                 return {}
-
-            response.raise_for_status()
             return response.json()
-        except requests.RequestException as e:
+        except (httpx.HTTPError, ValueError) as e:
             print(f'❌ API error on {method} request to {endpoint}: {e}')
             return {}
 
     def list_streams(self):
         """Retrieve a list of all streams, returning an empty dict if none exist."""
-        return self._send_request('GET', '/api/streams')
+        return self._cached_get('/api/streams')
 
     def add_stream(self, name, src):
         """Add a new stream and start recording it continuously."""
         result = self._send_request('PUT', '/api/streams', {'name': name, 'src': src})
+        self._cache.pop('/api/streams', None)
         self.start_recording(name)
         return result
 
+    async def add_streams(self, pairs):
+        """Add several (name, src) streams with concurrent API calls, then start recording all of them."""
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=5) as client:
+            results = await asyncio.gather(*[
+                self._send_request_async(client, 'PUT', '/api/streams', {'name': name, 'src': src})
+                for name, src in pairs
+            ])
+        self._cache.pop('/api/streams', None)
+
+        # start_recording only submits work and mutates self.recorders, so run it sequentially
+        for name, _ in pairs:
+            self.start_recording(name)
+        return results
+
     def update_stream(self, name, src):
         """Update an existing stream."""
-        return self._send_request('PUT', '/api/streams', {'name': name, 'src': src})
+        result = self._send_request('PUT', '/api/streams', {'name': name, 'src': src})
+        self._cache.pop('/api/streams', None)
+        return result
 
     def delete_stream(self, src):
         """Delete a stream and stop recording."""
         result = self._send_request('DELETE', '/api/streams', {'src': src})
+        self._cache.pop('/api/streams', None)
         if result:
             self.stop_recording(src)
         return result
 
     def discover_ffmpeg_devices(self):
         """Discover FFmpeg-compatible USB devices."""
-        return self._send_request('GET', '/api/ffmpeg/devices')
+        return self._cached_get('/api/ffmpeg/devices')
 
     def discover_onvif_cameras(self):
         """Discover ONVIF cameras on the network."""
-        return self._send_request('GET', '/api/onvif')
+        return self._cached_get('/api/onvif')
 
     def start_recording(self, stream_name):
-        """Start recording a stream continuously using RTSP format."""
+        """Start recording a stream continuously using RTSP format; raises RuntimeError if every worker is busy."""
+        # Forget recordings that ended on their own (source errors, failed discovery) so they can be restarted
+        for name in [name for name, recorder in self.recorders.items() if not recorder.running()]:
+            del self.recorders[name]
+
         if stream_name not in self.recorders:
             stream_url = f"rtsp://localhost:8554/{stream_name}"  # Generate RTSP URL dynamically
             print(f"🎬 Starting recording for {stream_name} at {stream_url}")
-            recorder = StreamRecorder(stream_url, self.output_dir)
-            self.recorders[stream_name] = recorder
-            recorder.start()
+            if self.supervisor:
+                self.recorders[stream_name] = self.supervisor.add_stream(stream_name, stream_url)
+            else:
+                # Each recording occupies a worker for its whole lifetime, so a full pool would never run it
+                if len(self.recorders) >= self.max_workers:
+                    raise RuntimeError(f"All {self.max_workers} recorder workers are busy, cannot record {stream_name}")
+
+                # Split the CPUs between running encoders instead of letting each one claim them all
+                threads_per_encoder = max(1, (os.cpu_count() or 1) // (len(self.recorders) + 1))
+                # One directory per stream so cameras never share (or merge) each other's segments
+                stream_dir = os.path.join(self.output_dir, stream_name)
+                stop_event = self._manager.Event()
+                try:
+                    future = self._pool.submit(
+                        run_recorder, stream_url, stream_dir, stop_event, encoder_threads=threads_per_encoder
+                    )
+                except BrokenProcessPool:
+                    # A crashed worker takes the whole pool (and every recording in it) down with it
+                    print("⚠️ Recorder worker pool broke after a worker crashed, restarting it")
+                    self._pool.shutdown(wait=False)
+                    self._pool = self._create_pool()
+                    future = self._pool.submit(
+                        run_recorder, stream_url, stream_dir, stop_event, encoder_threads=threads_per_encoder
+                    )
+                self.recorders[stream_name] = RecorderProcess(future, stop_event)
         else:
             print(f"⚠️ Recording already running for {stream_name}")
 
@@ -121,3 +275,5 @@ if __name__ == '__main__':
     if client.delete_stream('my_stream'):
         print('🗑️ Stream deleted successfully')
 
+    client.close()
+
@@ -0,0 +1,36 @@
+SINK_BUFFER_SIZE = 4 * 1024 * 1024  # filesink buffers writes into 4 MiB chunks
+WRITE_QUEUE_SIZE = 16 * 1024 * 1024  # Up to 16 MiB of encoded video held in RAM while the disk catches up
+
+
+def rtsp_source(stream_url, latency_ms, protocols):
+    """Build the rtspsrc element with a small jitter buffer for low-latency live recording."""
+    return [
+        'rtspsrc', f'location={stream_url}', f'latency={latency_ms}',
+        f'protocols={protocols}', 'drop-on-latency=true', 'do-retransmission=false', 'buffer-mode=auto'
+    ]
+
+
+def h264_remux():
+    """Depayload and parse H.264 into whole access units so it can be muxed without re-encoding."""
+    return ['rtph264depay', '!', 'h264parse', 'config-interval=-1', '!', 'video/x-h264,alignment=au']
+
+
+def segment_sink(location, segment_time):
+    """Build the muxer/sink part of the pipeline, splitting the recording into playable segments."""
+    # The queue lets disk writeback lag behind the stream without stalling it. Keyframe requests make
+    # each segment start on an IDR frame. splitmuxsink only honours muxer-factory, sink-factory and
+    # sink-properties in async-finalize mode; otherwise it silently falls back to mp4mux and a
+    # default-configured filesink, losing the larger write buffer and the sync=false/async=false that
+    # keep the sink from waiting on the pipeline clock, which a file has no use for.
+    return [
+        'queue', 'max-size-buffers=0', f'max-size-bytes={WRITE_QUEUE_SIZE}', 'max-size-time=0', 'leaky=no',
+        '!', 'splitmuxsink', 'name=segments', 'async-finalize=true', 'muxer-factory=matroskamux',
+        'sink-factory=filesink', f'max-size-time={segment_time * 1_000_000_000}', 'send-keyframe-requests=true',
+        f'sink-properties="properties,buffer-size=(guint){SINK_BUFFER_SIZE},sync=(boolean)false,async=(boolean)false"',
+        f'location={location}'
+    ]
+
+
+def launch_description(args):
+    """Join pipeline arguments into one launch string, escaping spaces the way gst_parse_launchv() does."""
+    return ' '.join(arg.replace(' ', '\\ ') for arg in args)
@@ -1,13 +1,69 @@
 import os
+import collections
 import datetime
+import itertools
+import queue
+import signal
+import socket
 import subprocess
+import tempfile
 import threading
 import time
+from urllib.parse import quote, urlsplit, urlunsplit
+
+import gi
+import numpy as np
+
+gi.require_version('Gst', '1.0')
+gi.require_version('GstPbutils', '1.0')
+gi.require_version('GstVideo', '1.0')
+from gi.repository import GLib, Gst, GstPbutils, GstVideo
+
+from pipelines import h264_remux, rtsp_source, segment_sink
+
+Gst.init(None)
+
+# One in-process discoverer shared by every recorder; discover_uri() is synchronous, so calls are serialized.
+_discoverer = GstPbutils.Discoverer.new(5 * Gst.SECOND)
+_discoverer_lock = threading.Lock()
+
+
+class FrameBufferPool:
+    """Ring of pre-allocated frame buffers reused by the frame callback pipeline instead of allocating per frame."""
+
+    def __init__(self, size):
+        self.size = size
+        self.shape = None
+        self._free = collections.deque()  # append/popleft are atomic, so no lock is needed across stages
+
+    def acquire(self, shape):
+        """Take a free buffer, (re)allocating the pool if the frame size changed."""
+        if shape != self.shape:
+            self.shape = shape
+            self._free = collections.deque(np.empty(shape, dtype=np.uint8) for _ in range(self.size))
+        try:
+            return self._free.popleft()
+        except IndexError:
+            return np.empty(shape, dtype=np.uint8)  # Every pooled buffer is in flight
+
+    def release(self, buffer):
+        """Return a buffer to the pool once the writer has copied it out."""
+        if buffer.shape == self.shape:
+            self._free.append(buffer)
+
 
 class StreamRecorder:
-    """Handles continuous recording of a stream using FFmpeg safely with automatic segment merging."""
+    """Handles continuous recording of a stream into time-based Matroska segments using GStreamer."""
+
+    # H.264 encoders in order of preference (Intel iGPU first, CPU last).
+    H264_ENCODERS = ('vaapih264enc', 'qsvh264enc', 'x264enc')
+    _h264_encoder = None  # Cached on the class so GStreamer is only probed once per process
+    DEFAULT_FPS = 30  # Used for keyframe spacing when the stream does not advertise a framerate
+    FRAME_QUEUE_SIZE = 8  # Decoded frames buffered between each stage of the frame callback pipeline
 
-    def __init__(self, stream_url, output_dir, segment_time=600, retry_interval=1, max_retries=30, username=None, password=None):
+    def __init__(self, stream_url, output_dir, segment_time=600, retry_interval=1, max_retries=30, username=None, password=None,
+                 copy_mode=True, x264_preset='veryfast', rtsp_latency_ms=100, rtsp_protocols='tcp',
+                 encoder_threads=0):
         """
         Initialize the StreamRecorder.
 
@@ -18,50 +74,126 @@ class StreamRecorder:
         :param max_retries: Maximum number of retries before failing.
         :param username: Optional username for RTSP authentication.
         :param password: Optional password for RTSP authentication.
+        :param copy_mode: Remux H.264 sources without re-encoding (default: True).
+        :param x264_preset: x264enc speed preset used when falling back to CPU encoding (default: veryfast).
+        :param rtsp_latency_ms: rtspsrc jitter buffer size in milliseconds (default: 100ms).
+        :param rtsp_protocols: RTSP lower transport protocols to allow (default: tcp).
+        :param encoder_threads: x264enc worker threads, 0 for one per CPU (default: 0).
         """
         self.stream_url = self._build_auth_url(stream_url, username, password)
         self.output_dir = output_dir
         self.segment_time = segment_time
         self.retry_interval = retry_interval
         self.max_retries = max_retries
+        self.copy_mode = copy_mode
+        self.x264_preset = x264_preset
+        self.rtsp_latency_ms = rtsp_latency_ms
+        self.rtsp_protocols = rtsp_protocols
+        self.encoder_threads = encoder_threads
+        self.source_is_h264 = False
+        self.fps = self.DEFAULT_FPS
         self.recording = False
         self.thread = None
-        self.file_list_path = os.path.join(self.output_dir, "file_list.txt")
+        self._proc = None  # Running gst-launch process, if any
+        self._reader = None  # Running in-process reader pipeline when a frame callback is attached
+        self._lock = threading.Lock()  # Orders stop() against pipeline startup so neither misses the other
+        self._abort = threading.Event()  # Set by stop() to tear the frame pipeline down if EOS doesn't get through
+        self._callback = None
+        self.encoder = self._detect_h264_encoder()
 
         os.makedirs(self.output_dir, exist_ok=True)
 
     def _build_auth_url(self, url, username, password):
         """Adds authentication to the RTSP URL if needed."""
         if username and password:
-            parsed_url = url.replace("rtsp://", f"rtsp://{username}:{password}@")
+            parts = urlsplit(url)
+            host = f'[{parts.hostname}]' if ':' in parts.hostname else parts.hostname
+            netloc = f'{quote(username, safe="")}:{quote(password, safe="")}@{host}'
+            if parts.port:
+                netloc += f':{parts.port}'
+            parsed_url = urlunsplit((parts.scheme, netloc, parts.path, parts.query, parts.fragment))
             print(f"🔐 Using authenticated RTSP URL: {parsed_url}")
             return parsed_url
         return url
 
+    @classmethod
+    def _detect_h264_encoder(cls):
+        """Pick the first H.264 encoder available to GStreamer, falling back to x264enc."""
+        if cls._h264_encoder is None:
+            cls._h264_encoder = next(
+                (encoder for encoder in cls.H264_ENCODERS if Gst.ElementFactory.find(encoder)),
+                'x264enc'
+            )
+            print(f"⚙️ Using H.264 encoder: {cls._h264_encoder}")
+        return cls._h264_encoder
+
+    def _source_pipeline(self):
+        """Build the rtspsrc element with this recorder's latency and transport settings."""
+        return rtsp_source(self.stream_url, self.rtsp_latency_ms, self.rtsp_protocols)
+
+    def _encoder_pipeline(self):
+        """Build the convert/encode part of the pipeline, keeping frames on the iGPU when possible."""
+        # Pin frames to NV12, the layout every encoder consumes natively. When the decoder already
+        # produces NV12 the converters pass buffers through untouched instead of converting each frame.
+        if self.encoder == 'vaapih264enc':
+            return [
+                'vaapipostproc', '!', 'video/x-raw(memory:VASurface),format=NV12', '!',
+                'vaapih264enc', 'rate-control=cbr', 'bitrate=2048', 'tune=low-power'
+            ]
+        if self.encoder == 'qsvh264enc':
+            return ['videoconvert', '!', 'video/x-raw,format=NV12', '!', 'qsvh264enc', 'rate-control=cbr', 'bitrate=2048']
+        return [
+            'videoconvert', '!', 'video/x-raw,format=NV12', '!',
+            'x264enc', 'tune=zerolatency', f'speed-preset={self.x264_preset}', 'bitrate=2048',
+            f'key-int-max={int(self.segment_time * self.fps)}', 'bframes=0',
+            f'threads={self.encoder_threads}', 'sliced-threads=true'
+        ]
+
+    def _sink_pipeline(self, location):
+        """Build the segmenting sink with this recorder's segment length."""
+        return segment_sink(location, self.segment_time)
+
+    def _tcp_probe(self):
+        """Check whether anything is listening on the RTSP server's port, without any GStreamer work."""
+        parts = urlsplit(self.stream_url)
+        try:
+            with socket.create_connection((parts.hostname, parts.port or 554), timeout=0.5):
+                return True
+        except OSError:
+            return False
+
     def _is_rtsp_available(self):
-        """Check if RTSP stream is available before recording using GStreamer."""
+        """Check if RTSP stream is available before recording using the in-process GStreamer discoverer."""
         for attempt in range(1, self.max_retries + 1):
+            if not self.recording:
+                return False
+
             print(f"⏳ Checking RTSP stream availability (Attempt {attempt}/{self.max_retries})...")
 
+            # Only pay for stream discovery once the server is accepting connections
+            if not self._tcp_probe():
+                print("⚠️ RTSP server is not accepting connections yet.")
+                time.sleep(self.retry_interval)
+                continue
+
             try:
-                result = subprocess.run(
-                    ['gst-discoverer-1.0', self.stream_url],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    timeout=5  # Prevents hanging
-                )
-
-                output = result.stdout.decode().strip()
-                error_output = result.stderr.decode().strip()
-
-                if result.returncode == 0 and "video" in output.lower():
-                    print(f"✅ RTSP stream is available! Details:\n{output}")
+                with _discoverer_lock:
+                    info = _discoverer.discover_uri(self.stream_url)
+
+                video_streams = info.get_video_streams()
+                if video_streams:
+                    video = video_streams[0]
+                    caps = video.get_caps()
+                    self.source_is_h264 = caps.get_structure(0).get_name() == 'video/x-h264'
+                    if video.get_framerate_num() and video.get_framerate_denom():
+                        self.fps = video.get_framerate_num() / video.get_framerate_denom()
+                    print(f"✅ RTSP stream is available! Details:\n{caps.to_string()}")
                     return True
                 else:
-                    print(f"⚠️ RTSP stream might be empty. Output:\n{output}\nErrors:\n{error_output}")
+                    print("⚠️ RTSP stream might be empty: no video streams discovered.")
 
-            except subprocess.TimeoutExpired:
-                print("⏳ GStreamer discovery timed out. Retrying...")
+            except GLib.Error as e:
+                print(f"⚠️ RTSP stream not ready yet: {e.message}")
             except Exception as e:
                 print(f"❌ Error checking RTSP stream: {e}")
 
@@ -71,67 +203,349 @@ class StreamRecorder:
         return False
 
     def _record(self):
-        """Optimized GStreamer RTSP recording with x264enc and Matroska format."""
-        if not self._is_rtsp_available():
+        """Optimized GStreamer RTSP recording to Matroska, remuxing H.264 sources and encoding the rest."""
+        if not self._is_rtsp_available() or not self.recording:
             return
 
         timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        output_file = os.path.join(self.output_dir, f"recording_{timestamp}.mkv")
-
-        gst_command_str = (
-            f'gst-launch-1.0 rtspsrc location={self.stream_url} ! decodebin '
-            '! videoconvert ! video/x-raw'        
-            '! x264enc tune=zerolatency speed-preset=ultrafast bitrate=2048 '
-            '! h264parse '
-            '! matroskamux '
-            f'! filesink location={output_file} sync=1 async=1'
-        )
+        output_file = os.path.join(self.output_dir, f"segment_{timestamp}_%05d.mkv")
 
-        try:
-            print(f"🎥 Starting GStreamer recording with x264enc: {output_file}")
-            process = subprocess.Popen(gst_command_str.split(), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                                       text=True)
+        if self._callback:
+            self._record_frames(output_file)
+            return
 
-            # Stream logs
-            for line in iter(process.stderr.readline, ''):
-                print(line, end='')
+        if self.copy_mode and self.source_is_h264:
+            # Source is already H.264, so remux straight into Matroska without decoding or encoding
+            mode = "stream copy"
+            gst_args = [
+                'gst-launch-1.0', '-q', '-e', *self._source_pipeline(),
+                '!', *h264_remux(),
+                '!', *self._sink_pipeline(output_file)
+            ]
+        else:
+            mode = self.encoder
+            gst_args = [
+                'gst-launch-1.0', '-q', '-e', *self._source_pipeline(),
+                '!', 'decodebin',
+                '!', *self._encoder_pipeline(),
+                '!', 'h264parse',
+                '!', *self._sink_pipeline(output_file)
+            ]
 
-            process.wait()
-        except subprocess.CalledProcessError as e:
+        log_file = os.path.join(self.output_dir, f"gst_{timestamp}.log")
+
+        try:
+            print(f"🎥 Starting GStreamer recording with {mode}: {output_file}")
+            # gst-launch writes its stderr straight to the log file's descriptor (and the OS page cache),
+            # so Python never touches the logs and needs no buffer of its own
+            with open(log_file, 'wb', buffering=0) as log:
+                with self._lock:
+                    if not self.recording:
+                        return
+                    # A process group of its own lets stop() send CTRL_BREAK to gst-launch alone on Windows
+                    process = self._proc = subprocess.Popen(
+                        gst_args, stdout=subprocess.DEVNULL, stderr=log,
+                        creationflags=subprocess.CREATE_NEW_PROCESS_GROUP if os.name == 'nt' else 0
+                    )
+
+                if process.wait() != 0:
+                    print(f"❌ GStreamer exited with code {process.returncode}, see {log_file}")
+                    self.recording = False
+        except OSError as e:
             print(f"❌ GStreamer error: {e}")
             self.recording = False
 
+    def _record_frames(self, output_file):
+        """Record through reader -> callback -> writer stages joined by bounded queues for back-pressure."""
+        reader = Gst.parse_launchv([
+            *self._source_pipeline(),
+            '!', 'decodebin',
+            '!', 'videoconvert', '!', 'video/x-raw,format=BGR',
+            '!', 'appsink', 'name=frames', 'emit-signals=true', f'max-buffers={self.FRAME_QUEUE_SIZE}', 'drop=false',
+            'sync=false'
+        ])
+        # BGR frames need converting for the encoder; x264 and QSV branches already start with a videoconvert
+        encoder = self._encoder_pipeline()
+        if encoder[0] != 'videoconvert':
+            encoder = ['videoconvert', '!', *encoder]
+        writer = Gst.parse_launchv([
+            'appsrc', 'name=frames', 'format=time', 'block=true',
+            '!', *encoder,
+            '!', 'h264parse',
+            '!', *self._sink_pipeline(output_file)
+        ])
+
+        frames_in = queue.Queue(maxsize=self.FRAME_QUEUE_SIZE)
+        frames_out = queue.Queue(maxsize=self.FRAME_QUEUE_SIZE)
+        frame_index = itertools.count()
+        closed = threading.Event()  # Set once the sentinel is queued; the reader must stop feeding frames_in
+        # Enough buffers for both queues plus one frame held by each stage
+        pool = FrameBufferPool(2 * self.FRAME_QUEUE_SIZE + 3)
+
+        def on_new_sample(sink):
+            # Runs on the GStreamer streaming thread; blocking on a full queue throttles the reader
+            if closed.is_set():
+                return Gst.FlowReturn.EOS
+            sample = sink.emit('pull-sample')
+            buffer = sample.get_buffer()
+            caps = sample.get_caps()
+            video_info = GstVideo.VideoInfo.new_from_caps(caps)
+
+            # Copy the mapped frame, whose rows may be padded, into a contiguous pooled frame
+            success, info = buffer.map(Gst.MapFlags.READ)
+            if not success:
+                return Gst.FlowReturn.ERROR
+            try:
+                frame = pool.acquire((video_info.height, video_info.width, 3))
+                np.copyto(frame, self._bgr_view(info.data, video_info))
+            finally:
+                buffer.unmap(info)
+
+            # Give up once shutdown starts, so the streaming thread can't stay blocked after the stages stop consuming
+            if self._put(frames_in, (next(frame_index), frame, buffer.pts, buffer.duration, caps), closed):
+                return Gst.FlowReturn.OK
+            pool.release(frame)
+            return Gst.FlowReturn.EOS
+
+        reader.get_by_name('frames').connect('new-sample', on_new_sample)
+        stages = [
+            threading.Thread(target=self._process_frames, args=(frames_in, frames_out), daemon=True),
+            threading.Thread(target=self._write_frames, args=(writer.get_by_name('frames'), frames_out, pool),
+                             daemon=True)
+        ]
+
+        with self._lock:
+            if not self.recording:
+                return
+            print(f"🎥 Starting GStreamer recording with frame callback and {self.encoder}: {output_file}")
+            self._reader = reader
+            for stage in stages:
+                stage.start()
+            writer.set_state(Gst.State.PLAYING)
+            reader.set_state(Gst.State.PLAYING)
+
+        bus = reader.get_bus()
+        message = None
+        while message is None and not self._abort.is_set():
+            message = bus.timed_pop_filtered(500 * Gst.MSECOND, Gst.MessageType.EOS | Gst.MessageType.ERROR)
+        if message and message.type == Gst.MessageType.ERROR:
+            print(f"❌ GStreamer error: {message.parse_error()[0].message}")
+            self.recording = False
+        if self._abort.is_set():
+            writer.set_state(Gst.State.NULL)  # Unblock a stuck writer so the stages can drain
+
+        # Drain the remaining frames through the callback and writer, then let the writer finalize
+        closed.set()
+        self._put(frames_in, None, self._abort)
+        for stage in stages:
+            stage.join()
+        message = writer.get_bus().timed_pop_filtered(10 * Gst.SECOND, Gst.MessageType.EOS | Gst.MessageType.ERROR)
+        if message and message.type == Gst.MessageType.ERROR:
+            print(f"❌ GStreamer error: {message.parse_error()[0].message}")
+
+        reader.set_state(Gst.State.NULL)
+        writer.set_state(Gst.State.NULL)
+        self._reader = None
+
+    def _process_frames(self, frames_in, frames_out):
+        """Callback stage: run the frame callback and pass its result on to the writer."""
+        while (item := self._get(frames_in, self._abort)) is not None:
+            idx, frame, pts, duration, caps = item
+            try:
+                result = self._callback(frame, idx)
+                if result is not None and result is not frame:
+                    frame[...] = result  # Write replacement frames back into the pooled buffer
+            except Exception as e:
+                print(f"❌ Frame callback failed on frame {idx}: {e}")
+            self._put(frames_out, (frame, pts, duration, caps), self._abort)
+
+        self._put(frames_out, None, self._abort)
+
+    @staticmethod
+    def _put(frames, item, stop):
+        """Put an item on a stage queue, waiting in slices and giving up once stop is set."""
+        while not stop.is_set():
+            try:
+                frames.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    @staticmethod
+    def _get(frames, stop):
+        """Take the next item from a stage queue, or None (like the sentinel) once stop is set."""
+        while not stop.is_set():
+            try:
+                return frames.get(timeout=0.5)
+            except queue.Empty:
+                pass
+        return None
+
+    @staticmethod
+    def _bgr_view(data, video_info):
+        """View a mapped BGR video buffer as a (height, width, 3) array, honouring its row stride."""
+        return np.ndarray(
+            (video_info.height, video_info.width, 3), dtype=np.uint8, buffer=data,
+            offset=video_info.offset[0], strides=(video_info.stride[0], 3, 1)
+        )
+
+    @staticmethod
+    def _maps_writable(buffers):
+        """Whether a pooled buffer maps to a writable view, which only the gst-python overrides provide."""
+        flow, buffer = buffers.acquire_buffer(None)
+        if flow != Gst.FlowReturn.OK:
+            return False
+        success, info = buffer.map(Gst.MapFlags.WRITE)
+        if not success:
+            return False
+        try:
+            return isinstance(info.data, memoryview) and not info.data.readonly
+        finally:
+            buffer.unmap(info)
+
+    def _pooled_frame(self, buffers, frame, video_info):
+        """Copy a frame in place into a buffer from the pool, or return None if none could be acquired or mapped."""
+        flow, buffer = buffers.acquire_buffer(None)
+        if flow != Gst.FlowReturn.OK:
+            return None
+        success, info = buffer.map(Gst.MapFlags.WRITE)
+        if not success:
+            return None
+        try:
+            np.copyto(self._bgr_view(info.data, video_info), frame)
+        finally:
+            buffer.unmap(info)
+        return buffer
+
+    def _write_frames(self, src, frames_out, pool):
+        """Writer stage: copy processed frames into pooled GStreamer buffers and push them, then end with EOS."""
+        flow = Gst.FlowReturn.OK
+        buffers = None  # Gst.BufferPool for the current caps, so pushing a frame doesn't allocate
+        staging = None  # Reused copy target when pooled buffers can't be written in place
+        current_caps = None
+        while (item := self._get(frames_out, self._abort)) is not None:
+            frame, pts, duration, caps = item
+            if flow == Gst.FlowReturn.OK:
+                try:
+                    if current_caps is None or not caps.is_equal(current_caps):
+                        if buffers is not None:
+                            buffers.set_active(False)
+                        current_caps = caps
+                        video_info = GstVideo.VideoInfo.new_from_caps(caps)
+                        src.set_property('caps', caps)
+                        buffers = Gst.BufferPool()
+                        config = buffers.get_config()
+                        Gst.BufferPool.config_set_params(config, caps, video_info.size, self.FRAME_QUEUE_SIZE, 0)
+                        buffers.set_config(config)
+                        buffers.set_active(True)
+                        staging = None
+                        if not self._maps_writable(buffers):
+                            print("⚠️ gst-python overrides not found, copying frames into new buffers instead")
+                            staging = np.zeros(video_info.size, dtype=np.uint8)
+
+                    if staging is None:
+                        buffer = self._pooled_frame(buffers, frame, video_info)
+                    else:
+                        np.copyto(self._bgr_view(staging, video_info), frame)
+                        buffer = Gst.Buffer.new_wrapped(staging.tobytes())
+
+                    if buffer is None:
+                        flow = Gst.FlowReturn.ERROR
+                    else:
+                        buffer.pts = pts
+                        buffer.duration = duration
+                        flow = src.emit('push-buffer', buffer)
+                except Exception as e:
+                    # A dead writer thread would leave the other stages blocked forever, so fail like a bad flow
+                    print(f"❌ Writing frame failed: {e}")
+                    flow = Gst.FlowReturn.ERROR
+
+                if flow != Gst.FlowReturn.OK:
+                    # Stop recording instead of silently discarding every frame from here on
+                    print(f"❌ Encoding pipeline stopped accepting frames: {flow.value_nick}")
+                    self.recording = False
+                    self._abort.set()
+            # Otherwise the writer pipeline has failed; keep draining so the other stages don't block
+
+            pool.release(frame)
+
+        src.emit('end-of-stream')
+        if buffers is not None:
+            buffers.set_active(False)  # Buffers still queued downstream are freed when they come back
+
+    def attach_callback(self, callback):
+        """
+        Run callback(frame, idx) on every decoded frame before it is re-encoded.
+
+        Frames are (height, width, 3) BGR uint8 arrays backed by a reused buffer pool: modify them in place, or
+        return a replacement array of the same shape. Don't keep references to a frame after the callback
+        returns. Attach before start(); attaching a callback always decodes, even in copy mode. Writing frames
+        into pooled GStreamer buffers needs the gst-python overrides (python3-gst-1.0); without them every
+        frame is copied into a new buffer instead.
+        """
+        self._callback = callback
+
     def start(self):
         """Start recording the stream in a separate thread."""
         if not self.recording:
             print(f"🎥 Waiting for RTSP stream to be available for {self.stream_url}")
             self.recording = True
+            self._abort.clear()
             self.thread = threading.Thread(target=self._record, daemon=True)
             self.thread.start()
 
+    def _interrupt(self, timeout=10):
+        """Interrupt gst-launch so it sends EOS and finalizes the Matroska index, killing it if it hangs."""
+        reader = self._reader
+        if reader is not None:
+            # In-process frame pipeline: EOS drains through the callback and writer stages by itself
+            reader.send_event(Gst.Event.new_eos())
+            self.thread.join(timeout)
+            if self.thread.is_alive():
+                print(f"⚠️ Frame pipeline did not finish within {timeout}s, forcing shutdown")
+                self._abort.set()
+            return
+
+        if self._proc is None or self._proc.poll() is not None:
+            return
+
+        self._proc.send_signal(signal.CTRL_BREAK_EVENT if os.name == 'nt' else signal.SIGINT)
+        try:
+            self._proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            print(f"⚠️ GStreamer did not finish within {timeout}s, killing it")
+            self._proc.kill()
+
     def stop(self):
-        """Stop recording the stream and merge segments into one file."""
+        """Stop recording the stream, leaving its segments in place."""
         if self.recording:
             print(f"🛑 Stopping recording for {self.stream_url}")
-            self.recording = False
+            with self._lock:
+                self.recording = False
+            self._interrupt()
             if self.thread:
                 self.thread.join()
 
-            self.merge_segments()
-
     def merge_segments(self):
-        """Automatically merge recorded segments into a single file when recording stops."""
+        """Merge recorded segments into a single file on request; segments are playable on their own."""
         print("🔄 Merging recorded segments into one file...")
 
-        # Create a list of recorded files
-        with open(self.file_list_path, "w") as f:
-            for file in sorted(os.listdir(self.output_dir)):
-                if file.startswith("segment_") and file.endswith(".mp4"):
-                    f.write(f"file '{os.path.join(self.output_dir, file)}'\n")
+        # Collect recorded segments in a single directory scan
+        with os.scandir(self.output_dir) as entries:
+            segments = sorted(
+                entry.path for entry in entries
+                if entry.is_file() and entry.name.startswith("segment_") and entry.name.endswith(".mkv")
+            )
 
-        merged_output = os.path.join(self.output_dir, "final_recording.mp4")
+        # Create a list of recorded files outside output_dir; concat resolves paths relative to the list
+        with tempfile.NamedTemporaryFile("w", delete=False, suffix=".txt") as f:
+            f.write(''.join(f"file '{os.path.abspath(path)}'\n" for path in segments))
+            list_path = f.name
+
+        merged_output = os.path.join(self.output_dir, "final_recording.mkv")
         merge_command = [
-            'ffmpeg', '-f', 'concat', '-safe', '0', '-i', self.file_list_path,
+            'ffmpeg', '-f', 'concat', '-safe', '0', '-i', list_path,
             '-c', 'copy', merged_output
         ]
 
@@ -140,11 +554,32 @@ class StreamRecorder:
             print(f"✅ Merged recording saved: {merged_output}")
 
             # Delete old segment files
-            for file in sorted(os.listdir(self.output_dir)):
-                if file.startswith("segment_") and file.endswith(".mp4"):
-                    os.remove(os.path.join(self.output_dir, file))
+            for path in segments:
+                os.remove(path)
         except subprocess.CalledProcessError as e:
             print(f"❌ Merging error: {e}")
+        finally:
+            os.unlink(list_path)
+
+
+def _exit_on_signal(signum, frame):
+    """Turn a termination signal into SystemExit so run_recorder can stop its GStreamer child first."""
+    raise SystemExit(128 + signum)
+
+
+def run_recorder(stream_url, output_dir, stop_event, **kwargs):
+    """Record a stream inside a worker process until stop_event is set."""
+    # The pool terminates every worker when one of them crashes; don't leave gst-launch recording unsupervised
+    signal.signal(signal.SIGTERM, _exit_on_signal)
+    recorder = StreamRecorder(stream_url, output_dir, **kwargs)
+    try:
+        recorder.start()
+        # Poll rather than block, so the worker slot is freed if the recording gives up on its own
+        while not stop_event.wait(1):
+            if not recorder.thread.is_alive():
+                break
+    finally:
+        recorder.stop()
 
 
 if __name__ == '__main__':
@@ -158,4 +593,5 @@ if __name__ == '__main__':
 
     recorder.start()  # Start recording
     time.sleep(30)  # Let it record for 30 seconds
-    recorder.stop()  # Stop and merge files
+    recorder.stop()  # Stop recording
+    recorder.merge_segments()  # Optional: Merge segments into one file
@@ -0,0 +1,174 @@
+import os
+import datetime
+import threading
+
+import gi
+
+gi.require_version('Gst', '1.0')
+from gi.repository import GLib, Gst
+
+from pipelines import h264_remux, launch_description, rtsp_source, segment_sink
+
+Gst.init(None)
+
+
+class SupervisedStream:
+    """Handle for a single stream branch recorded by a RecorderSupervisor."""
+
+    def __init__(self, supervisor, name):
+        self.supervisor = supervisor
+        self.name = name
+
+    def running(self):
+        """Whether the branch is still attached; branches that hit an error are released automatically."""
+        with self.supervisor.lock:
+            return self.name in self.supervisor.branches
+
+    def stop(self):
+        """Stop recording this stream and detach its branch from the shared pipeline."""
+        self.supervisor.remove_stream(self.name)
+
+
+class RecorderSupervisor:
+    """Records many H.264 RTSP streams through one shared GStreamer pipeline driven by a single main loop."""
+
+    def __init__(self, output_dir, segment_time=600, rtsp_latency_ms=100, rtsp_protocols='tcp'):
+        """
+        Initialize the RecorderSupervisor.
+
+        :param output_dir: Directory to save the recordings.
+        :param segment_time: Duration of each segment file (default: 10 minutes).
+        :param rtsp_latency_ms: rtspsrc jitter buffer size in milliseconds (default: 100ms).
+        :param rtsp_protocols: RTSP lower transport protocols to allow (default: tcp).
+        """
+        self.output_dir = output_dir
+        self.segment_time = segment_time
+        self.rtsp_latency_ms = rtsp_latency_ms
+        self.rtsp_protocols = rtsp_protocols
+        self.branches = {}  # Active branches {stream_name: Gst.Bin}
+        self.lock = threading.Lock()  # Guards branches, which the caller and main loop threads both change
+        self._stopping = {}  # Branches waiting for their last segment to close {stream_name: threading.Event}
+        self._ended = set()  # Branches whose EOS has reached splitmuxsink, so their next closed fragment is the last
+        self.thread = None
+
+        self.pipeline = Gst.Pipeline.new('recorder-supervisor')
+        self.loop = GLib.MainLoop()
+        bus = self.pipeline.get_bus()
+        bus.add_signal_watch()
+        bus.connect('message', self._on_message)
+
+        os.makedirs(self.output_dir, exist_ok=True)
+
+    def _branch_description(self, name, stream_url):
+        """Build a remux-only branch: RTP depayload straight into time-based Matroska segments."""
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        location = os.path.join(self.output_dir, name, f"segment_{timestamp}_%05d.mkv")
+        return launch_description([
+            *rtsp_source(stream_url, self.rtsp_latency_ms, self.rtsp_protocols),
+            '!', *h264_remux(),
+            '!', *segment_sink(location, self.segment_time)
+        ])
+
+    def _branch_name(self, element):
+        """Find the stream whose branch contains the given element."""
+        with self.lock:
+            branches = list(self.branches.items())
+        while element is not None:
+            for name, branch in branches:
+                if branch is element:
+                    return name
+            element = element.get_parent()
+        return None
+
+    def _on_message(self, bus, message):
+        """Handle bus messages on the main loop thread."""
+        if message.type == Gst.MessageType.ERROR:
+            error, debug = message.parse_error()
+            name = self._branch_name(message.src)
+            print(f"❌ GStreamer error on {name or 'pipeline'}: {error.message}")
+            if name:
+                self._release_branch(name)
+        elif message.type == Gst.MessageType.ELEMENT:
+            structure = message.get_structure()
+            if structure and structure.has_name('splitmuxsink-fragment-closed'):
+                # Ordinary rollovers also close fragments; only the one closed by EOS finalizes the branch
+                name = self._branch_name(message.src)
+                with self.lock:
+                    ended = name in self._ended
+                if ended:
+                    self._release_branch(name)
+
+    def _on_sink_event(self, pad, info, name):
+        """Pad probe on a branch's splitmuxsink: note when EOS reaches it."""
+        if info.get_event().type == Gst.EventType.EOS:
+            with self.lock:
+                self._ended.add(name)
+        return Gst.PadProbeReturn.OK
+
+    def _release_branch(self, name):
+        """Shut down a branch and remove it from the pipeline; must run on the main loop thread."""
+        with self.lock:
+            branch = self.branches.pop(name, None)
+            self._ended.discard(name)
+        if branch is not None:
+            branch.set_state(Gst.State.NULL)
+            self.pipeline.remove(branch)
+            print(f"✅ Recording branch for {name} released")
+
+        done = self._stopping.pop(name, None)
+        if done:
+            done.set()
+        return False  # Don't repeat when scheduled through GLib.idle_add
+
+    def start(self):
+        """Start the shared pipeline and its main loop in a separate thread."""
+        if self.thread is None:
+            self.pipeline.set_state(Gst.State.PLAYING)
+            self.thread = threading.Thread(target=self.loop.run, daemon=True)
+            self.thread.start()
+
+    def add_stream(self, name, stream_url):
+        """Attach a recording branch for the stream to the running pipeline."""
+        with self.lock:
+            if name in self.branches:
+                print(f"⚠️ Recording already running for {name}")
+                return SupervisedStream(self, name)
+
+            # One directory per stream, laid out like StreamRecorder's so merge_segments works on it too
+            os.makedirs(os.path.join(self.output_dir, name), exist_ok=True)
+            branch = Gst.parse_bin_from_description(self._branch_description(name, stream_url), False)
+            branch.get_by_name('segments').get_static_pad('video').add_probe(
+                Gst.PadProbeType.EVENT_DOWNSTREAM, self._on_sink_event, name
+            )
+            self.branches[name] = branch
+        self.pipeline.add(branch)
+        branch.sync_state_with_parent()
+        return SupervisedStream(self, name)
+
+    def remove_stream(self, name, timeout=10):
+        """Send EOS through the stream's branch so its last segment is finalized, then detach it."""
+        with self.lock:
+            branch = self.branches.get(name)
+        if branch is None:
+            print(f"⚠️ No recording branch found for {name}")
+            return
+
+        done = self._stopping.setdefault(name, threading.Event())
+        branch.send_event(Gst.Event.new_eos())
+        if not done.wait(timeout):
+            print(f"⚠️ {name} did not finalize within {timeout}s, forcing shutdown")
+            GLib.idle_add(self._release_branch, name)
+            done.wait(timeout)
+
+    def stop(self):
+        """Stop every branch, then tear down the pipeline and main loop."""
+        with self.lock:
+            names = list(self.branches)
+        for name in names:
+            self.remove_stream(name)
+
+        self.pipeline.set_state(Gst.State.NULL)
+        self.loop.quit()
+        if self.thread:
+            self.thread.join()
+            self.thread = None